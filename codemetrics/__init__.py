@@ -14,6 +14,8 @@ from .core import (
     get_ages,
     get_co_changes,
     get_complexity,
+    get_complexity_batch,
+    get_complexity_parallel,
     get_hot_spots,
     get_mass_changes,
     guess_components,
@@ -1,14 +1,21 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import concurrent.futures
+import itertools
+import operator
 import os.path
 import typing
 
+import joblib
 import lizard
+import numpy as np
 import pandas as pd
+import scipy.sparse
 import sklearn
 import sklearn.cluster
 import sklearn.feature_extraction.text
+import sklearn.pipeline
 
 from . import internals, scm
 
@@ -19,9 +26,14 @@ __all__ = [
     "get_co_changes",
     "guess_components",
     "get_complexity",
+    "get_complexity_parallel",
+    "get_complexity_batch",
 ]
 
 
+_ns_per_day = pd.Timedelta(1, unit="D").value
+
+
 def get_mass_changes(
     log: pd.DataFrame, min_path: int = None, max_changes_per_path: float = None
 ) -> pd.DataFrame:
@@ -43,10 +55,12 @@ def get_mass_changes(
         with columns revision, path, changes and changes_per_path.
 
     """
-    data = log.reset_index().copy()[["revision", "path", "added", "removed"]]
-    data["changes"] = data["added"] + data["removed"]
+    columns = ["revision", "path", "added", "removed"]
+    if not set(columns).issubset(log.columns):
+        log = log.reset_index()
     data = (
-        data[["revision", "path", "changes"]]
+        log[["revision", "path"]]
+        .assign(changes=log["added"] + log["removed"])
         .groupby("revision", as_index=False)
         .agg({"path": "count", "changes": "sum"})
         .assign(revision=lambda x: x["revision"].astype("string"))
@@ -83,10 +97,24 @@ def get_ages(
     if by is None:
         by = ["path"]
     now = pd.to_datetime(internals.get_now(), utc=True)
-    rv = data.groupby(by)["date"].max().reset_index()
-    rv["age"] = now - pd.to_datetime(rv["date"], utc=True)
-    rv["age"] /= pd.Timedelta(1, unit="D")
-    return rv.drop(columns=["date"])
+    rv = data.groupby(by, sort=False, observed=True)["date"].max().reset_index()
+    # Grouping rebuilds the categories in order of appearance: restore the
+    # input categories so keys sort in category order and merge with the input.
+    for key in by:
+        keys = data[key] if key in data else data.index.get_level_values(key)
+        if isinstance(keys.dtype, pd.CategoricalDtype):
+            rv[key] = rv[key].cat.set_categories(
+                keys.dtype.categories, ordered=keys.dtype.ordered
+            )
+    rv = rv.sort_values(by=by, ignore_index=True)
+    dates = rv.pop("date")
+    if not isinstance(dates.dtype, pd.DatetimeTZDtype):
+        dates = pd.to_datetime(dates, utc=True)
+    # Work on nanoseconds since epoch to avoid building Timedelta objects.
+    dates_ns = dates.values.astype("datetime64[ns]").view("i8")
+    age = (now.value - dates_ns) / _ns_per_day
+    rv["age"] = np.where(dates.isna(), np.nan, age)
+    return rv
 
 
 def get_hot_spots(log, loc, by=None, count_one_change_per=None):
@@ -113,8 +141,21 @@ def get_hot_spots(log, loc, by=None, count_one_change_per=None):
         count_one_change_per = ["revision"]
     c_df = loc.copy()
     c_df = c_df.rename(columns={"code": "lines"})
-    columns = count_one_change_per + [by]
-    ch_df = log[columns].drop_duplicates()[by].value_counts().to_frame("changes")
+    if len(count_one_change_per) == 1:
+        ch_df = (
+            log.groupby(by, sort=False, observed=True)[count_one_change_per[0]]
+            .nunique(dropna=False)
+            .to_frame("changes")
+        )
+    else:
+        columns = count_one_change_per + [by]
+        ch_df = (
+            log[columns]
+            .drop_duplicates()[by]
+            .value_counts(sort=False)
+            .to_frame("changes")
+        )
+    ch_df["changes"] = ch_df["changes"].astype("Int64")
     df = pd.merge(c_df, ch_df, right_index=True, left_on=by, how="outer").reset_index(
         drop=True
     )
@@ -144,54 +185,96 @@ def get_co_changes(log=None, by=None, on=None):
         by = "path"
     if on is None:
         on = "revision"
-    df = log[[on, by]].drop_duplicates()
-    sj = (
-        pd.merge(df, df, on=on)
-        .rename(columns={by + "_x": by, by + "_y": "dependency"})
-        .groupby([by, "dependency"])
-        .count()
-        .reset_index()
+    df = log[[on, by]].drop_duplicates().dropna()
+    # Incidence matrix of on x by: M.T @ M yields the change counts on the
+    # diagonal and the co-change counts off the diagonal.
+    on_codes, on_uniques = pd.factorize(df[on])
+    by_codes, by_uniques = pd.factorize(df[by], sort=True)
+    incidence = scipy.sparse.csr_matrix(
+        (np.ones(len(df), dtype=np.int32), (on_codes, by_codes)),
+        shape=(len(on_uniques), len(by_uniques)),
     )
-    result = pd.merge(
-        sj[sj[by] == sj["dependency"]][[by, on]], sj[sj[by] != sj["dependency"]], on=by
-    ).rename(columns={on + "_x": "changes", on + "_y": "cochanges"})
-    result["coupling"] = result["cochanges"] / result["changes"]
-    return result[[by, "dependency", "changes", "cochanges", "coupling"]].sort_values(
-        by="coupling", ascending=False
+    # Counts stay int32 like the incidence matrix; they are bounded by the
+    # number of revisions. Only observed values of categorical keys are kept.
+    co_occurrences = (incidence.T @ incidence).tocoo()
+    changes = co_occurrences.diagonal()
+    off_diagonal = co_occurrences.row != co_occurrences.col
+    primary = co_occurrences.row[off_diagonal]
+    secondary = co_occurrences.col[off_diagonal]
+    cochanges = co_occurrences.data[off_diagonal]
+    order = np.lexsort((secondary, primary))
+    primary, secondary, cochanges = primary[order], secondary[order], cochanges[order]
+    result = pd.DataFrame(
+        {
+            by: by_uniques.take(primary),
+            "dependency": by_uniques.take(secondary),
+            "changes": changes[primary].astype(np.int32),
+            "cochanges": cochanges.astype(np.int32),
+        }
     )
+    result["coupling"] = result["cochanges"] / result["changes"]
+    return result.sort_values(by="coupling", ascending=False)
 
 
-def guess_components(paths, stop_words=None, n_clusters=8):
+def guess_components(paths, stop_words=None, n_clusters=8, random_state=None):
     """Guess components from an iterable of paths.
 
     Args:
         paths: list of string containing file paths in the project.
-        stop_words: stop words. Passed to TfidfVectorizer.
+        stop_words: stop words. Passed to HashingVectorizer.
         n_clusters: number of clusters. Passed to MiniBatchKMeans.
+        random_state: seed for the cluster initialization. Passed to
+            MiniBatchKMeans.
 
     Returns:
         pandas.DataFrame
 
     See Also:
-        sklearn.feature_extraction.text.TfidfVectorizer
+        sklearn.feature_extraction.text.HashingVectorizer
+        sklearn.feature_extraction.text.TfidfTransformer
         sklearn.cluster.MiniBatchKMeans
 
     """
     dirs = [os.path.dirname(p.replace("\\", "/")) for p in paths]
-    vectorizer = sklearn.feature_extraction.text.TfidfVectorizer(stop_words=stop_words)
+    # Hashing the tokens avoids building a vocabulary before fitting. Counts
+    # are left unnormalized so the pipeline is equivalent to TfidfVectorizer.
+    hasher = sklearn.feature_extraction.text.HashingVectorizer(
+        n_features=2 ** 17, alternate_sign=False, norm=None, stop_words=stop_words
+    )
+    vectorizer = sklearn.pipeline.Pipeline(
+        [
+            ("hash", hasher),
+            ("tfidf", sklearn.feature_extraction.text.TfidfTransformer()),
+        ]
+    )
     transformed_dirs = vectorizer.fit_transform(dirs)
-    algo = sklearn.cluster.MiniBatchKMeans
-    clustering = algo(compute_labels=True, n_clusters=n_clusters)
+    # transformed_dirs stays sparse: MiniBatchKMeans consumes CSR input as is.
+    clustering = sklearn.cluster.MiniBatchKMeans(
+        n_clusters=n_clusters,
+        init="k-means++",
+        batch_size=min(1024, transformed_dirs.shape[0]),
+        compute_labels=True,
+        random_state=random_state,
+    )
     clustering.fit(transformed_dirs)
 
+    # Map hashed feature indices back to tokens, only to name the clusters.
+    analyzer = hasher.build_analyzer()
+    tokens = sorted({token for d in set(dirs) for token in analyzer(d)})
+    rows, indices = hasher.transform(tokens).nonzero()
+    feature_names = {index: tokens[row] for row, index in zip(rows, indices)}
+
     def __cluster_name(center, threshold):
+        features = np.flatnonzero(center > threshold)
+        if len(features) == 0:
+            return ""
         df = pd.DataFrame(
-            data={"feature": vectorizer.get_feature_names(), "weight": center}
+            data={
+                "feature": [feature_names[i] for i in features],
+                "weight": center[features],
+            }
         )
         df.sort_values(by=["weight", "feature"], ascending=False, inplace=True)
-        if (df["weight"] <= threshold).all():
-            return ""
-        df = df[df["weight"] > threshold]
         return ".".join(df["feature"].tolist())
 
     cluster_names = [
@@ -242,14 +325,20 @@ def get_complexity(
         internals.log.info("empty group %s", group)
         return pd.DataFrame({k: [] for k in _complexity_fields})
     downloaded = project.download(group)
+    return _analyze_complexity(downloaded)
+
+
+def _analyze_complexity(downloaded: scm.DownloadResult) -> pd.DataFrame:
+    """Run lizard on downloaded content and format its function-level output."""
     path = downloaded.path
     content = downloaded.content
     info = lizard.analyze_file.analyze_source_code(path, content)
-    df = pd.DataFrame(columns=_lizard_fields)
-    if info.function_list:
-        df = pd.DataFrame.from_records(
-            [vars(d) for d in info.function_list], columns=_lizard_fields
-        )
+    # Build the frame column by column rather than from one dict per function.
+    columns = {
+        fld: list(map(operator.attrgetter(fld), info.function_list))
+        for fld in _lizard_fields
+    }
+    df = pd.DataFrame(columns, columns=_lizard_fields)
     df = (
         df.rename_axis("function")
         .assign(
@@ -269,3 +358,127 @@ def get_complexity(
         .astype({"name": "string", "long_name": "string"})
     )
     return df
+
+
+def _download(revision: str, path: str, project: scm.Project) -> scm.DownloadResult:
+    """Download one path at one revision."""
+    return project.download(pd.Series({"revision": revision, "path": path}))
+
+
+def _get_complexity_of(revision: str, path: str, project: scm.Project) -> pd.DataFrame:
+    """Download one path at one revision and analyze it with lizard."""
+    return _analyze_complexity(_download(revision, path, project))
+
+
+def _revision_path_pairs(log: pd.DataFrame) -> pd.DataFrame:
+    """Unique (revision, path) pairs of the log sorted like groupby() does."""
+    return (
+        log[["revision", "path"]]
+        .drop_duplicates()
+        .sort_values(["revision", "path"])
+        .reset_index(drop=True)
+    )
+
+
+def _concat_complexity(
+    results: typing.Sequence[pd.DataFrame], pairs: pd.DataFrame
+) -> pd.DataFrame:
+    """Stitch per (revision, path) results like groupby().apply() would."""
+    if not results:
+        index = pd.MultiIndex.from_tuples([], names=["revision", "path", "function"])
+        return pd.DataFrame({k: [] for k in _complexity_fields}, index=index)
+    keys = list(pairs.itertuples(index=False, name=None))
+    df = pd.concat(results, keys=keys, names=["revision", "path", "function"])
+    # concat builds object levels, keep the dtypes of the log like groupby().
+    levels = [
+        level.astype(pairs[col].dtype) for level, col in zip(df.index.levels, pairs)
+    ]
+    return df.set_axis(df.index.set_levels(levels, level=[0, 1]), axis=0)
+
+
+def get_complexity_parallel(
+    log: pd.DataFrame,
+    project: scm.Project,
+    n_jobs: int = -1,
+    engine: str = "joblib",
+) -> pd.DataFrame:
+    """Generate complexity information in parallel for a whole log.
+
+    Equivalent to `log.groupby(['revision', 'path']).apply(get_complexity, project)`,
+    including the sort order of the index, but each (revision, path) pair is
+    downloaded and analyzed in its own worker.
+    With n_jobs=1, the pairs are processed in a plain loop in the calling
+    process, which is still cheaper than going through groupby().apply().
+
+    Args:
+        log: contains at least path and revision columns.
+        project: scm.Project derived class used to retrieve files for specific revision.
+        n_jobs: number of workers. Defaults to -1 (all cores). See joblib.Parallel.
+        engine: joblib (default) or dask. dask requires dask[bag] to be installed.
+            Ignored when n_jobs is 1.
+
+    Returns:
+        Dataframe containing output of function-level lizard.analyze_ indexed by
+        revision, path and function.
+
+    Example::
+
+        import codemetrics as cm
+        project = cm.GitProject()
+        log = cm.get_log(project)
+        complexity = cm.get_complexity_parallel(log, project)
+
+    .. _lizard.analyze: https://github.com/terryyin/lizard
+
+    """
+    pairs = _revision_path_pairs(log)
+    keys = list(pairs.itertuples(index=False, name=None))
+    if n_jobs == 1:
+        results = [
+            _get_complexity_of(revision, path, project) for revision, path in keys
+        ]
+    elif engine == "joblib":
+        results = joblib.Parallel(n_jobs=n_jobs, backend="loky")(
+            joblib.delayed(_get_complexity_of)(revision, path, project)
+            for revision, path in keys
+        )
+    elif engine == "dask":
+        import dask.bag
+
+        results = (
+            dask.bag.from_sequence(keys)
+            .starmap(_get_complexity_of, project=project)
+            .compute()
+        )
+    else:
+        raise ValueError(f"unknown engine {engine}, expected joblib or dask")
+    return _concat_complexity(results, pairs)
+
+
+def get_complexity_batch(
+    log: pd.DataFrame, project: scm.Project, max_workers: int = 8
+) -> pd.DataFrame:
+    """Generate complexity information for a whole log with threaded downloads.
+
+    Downloads are I/O bound so they run in a pool of threads while the files
+    already retrieved are analyzed with lizard in the calling thread. Use
+    `get_complexity_parallel` to spread the analysis itself across processes.
+
+    Args:
+        log: contains at least path and revision columns.
+        project: scm.Project derived class used to retrieve files for specific revision.
+        max_workers: number of download threads.
+
+    Returns:
+        Dataframe containing output of function-level lizard.analyze_ indexed by
+        revision, path and function.
+
+    .. _lizard.analyze: https://github.com/terryyin/lizard
+
+    """
+    pairs = _revision_path_pairs(log)
+    revisions, paths = pairs["revision"].tolist(), pairs["path"].tolist()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        downloads = executor.map(_download, revisions, paths, itertools.repeat(project))
+        results = [_analyze_complexity(downloaded) for downloaded in downloads]
+    return _concat_complexity(results, pairs)
@@ -255,10 +255,10 @@ class GitProject(scm.Project):
 
         """
         downloader = _GitFileDownloader(git_client=self.client, cwd=self.cwd)
-        df = data[["revision", "path"]]
-        if isinstance(df, pd.Series):
-            df = df.to_frame().T
-        revision, path = next(df.itertuples(index=False))
+        if isinstance(data, pd.Series):
+            revision, path = data["revision"], data["path"]
+        else:
+            revision, path = data["revision"].iat[0], data["path"].iat[0]
         return downloader.download(revision, path)
 
     def get_log(
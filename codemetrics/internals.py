@@ -3,10 +3,12 @@
 
 """Metrics offer a bunch of function useful to analyze a code base."""
 
+import contextlib
 import datetime as dt
 import logging
 import pathlib as pl
 import subprocess
+import tempfile
 import typing
 
 import pandas as pd
@@ -14,6 +16,9 @@ import pandas as pd
 log = logging.getLogger("codemetrics")
 log.addHandler(logging.NullHandler())
 
+# Seconds run_streaming waits for a command to exit after its output failed.
+_exit_grace_period = 1.0
+
 
 def get_now():
     """Get current time stamp.
@@ -73,6 +78,33 @@ def check_run_in_root(path, cwd=None):
     raise ValueError(f"{candidate} does not appear to be a git or svn root")
 
 
+def _run(cmd_list: typing.List[str], **kwargs) -> subprocess.CompletedProcess:
+    """Run the command with `subprocess.run` and turn failures into ValueError.
+
+    Shared by `run` and `run_bytes`. See `run` for the arguments.
+
+    """
+    cwd = pl.Path(kwargs.get("cwd", ".")).absolute()
+    command = " ".join(cmd_list) + f" (in {cwd})"
+    log.info(command)
+    try:
+        return subprocess.run(
+            cmd_list,
+            check=True,
+            shell=False,  # see https://security.openstack.org/guidelines/dg_avoid-shell-true.html
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            **kwargs,
+        )
+    except subprocess.CalledProcessError as err:
+        stderr = err.stderr
+        if isinstance(stderr, bytes):
+            stderr = stderr.decode("utf-8", errors="ignore")
+        raise ValueError(f"failed to execute {command}: {stderr}")
+    except FileNotFoundError:
+        raise ValueError(f"failed to execute {command}: file not found")
+
+
 def run(cmd_list: typing.List[str], **kwargs) -> str:
     """Execute command passed as argument and return output.
 
@@ -104,23 +136,91 @@ def run(cmd_list: typing.List[str], **kwargs) -> str:
     """
     if "errors" not in kwargs:
         kwargs["errors"] = "ignore"
+    return _run(cmd_list, **kwargs).stdout  # No split. See __doc__.
+
+
+def run_bytes(cmd_list: typing.List[str], **kwargs) -> bytes:
+    """Execute command passed as argument and return raw output.
+
+    Same as `run` but the output is not decoded nor translated for universal
+    newlines. Leaves it to the caller to decode the output once.
+
+    Args:
+        cmd_list: command to execute.
+        **kwargs: additional kwargs are passed to subprocess.run(). In particular:
+        cwd: path in which to execute the command.
+
+    Returns:
+        Output of the command as bytes.
+
+    Raise:
+        ValueError if the command is not executed properly.
+
+    """
+    return _run(cmd_list, **kwargs).stdout
+
+
+@contextlib.contextmanager
+def run_streaming(
+    cmd_list: typing.List[str], **kwargs
+) -> typing.Iterator[typing.IO[bytes]]:
+    """Execute command passed as argument and stream its output.
+
+    Unlike `run`, the output is not buffered in memory: the context manager
+    yields the binary stdout pipe of the process so it can be consumed while
+    the command runs. stderr goes to a temporary file so the process cannot
+    block on a full stderr pipe.
+
+    Args:
+        cmd_list: command to execute.
+        **kwargs: additional kwargs are passed to subprocess.Popen(). In particular:
+        cwd: path in which to execute the command.
+
+    Yields:
+        stdout of the command as a binary stream.
+
+    Raise:
+        ValueError if the command cannot be executed or does not return 0.
+
+    """
     cwd = pl.Path(kwargs.get("cwd", ".")).absolute()
     command = " ".join(cmd_list) + f" (in {cwd})"
     log.info(command)
-    try:
-        result = subprocess.run(
-            cmd_list,
-            check=True,
-            shell=False,  # see https://security.openstack.org/guidelines/dg_avoid-shell-true.html
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            **kwargs,
-        )
-    except subprocess.CalledProcessError as err:
-        raise ValueError(f"failed to execute {command}: {err.stderr}")
-    except FileNotFoundError:
-        raise ValueError(f"failed to execute {command}: file not found")
-    return result.stdout  # No split. See __doc__.
+    with tempfile.TemporaryFile() as stderr:
+        try:
+            proc = subprocess.Popen(
+                cmd_list,
+                shell=False,  # see https://security.openstack.org/guidelines/dg_avoid-shell-true.html
+                stdout=subprocess.PIPE,
+                stderr=stderr,
+                **kwargs,
+            )
+        except FileNotFoundError:
+            raise ValueError(f"failed to execute {command}: file not found")
+        assert proc.stdout is not None
+
+        def failure() -> ValueError:
+            stderr.seek(0)
+            errors = stderr.read().decode(errors="ignore")
+            return ValueError(f"failed to execute {command}: {errors}")
+
+        with proc:
+            try:
+                yield proc.stdout
+            except BaseException as exc:
+                # The consumer typically fails on truncated output when the
+                # command itself failed: give it a moment to exit so its
+                # diagnostic is reported rather than the consumer's error.
+                try:
+                    proc.wait(timeout=_exit_grace_period)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+                if proc.wait() > 0:
+                    raise failure() from exc
+                raise
+            returncode = proc.wait()
+        if returncode != 0:
+            raise failure()
 
 
 def handle_default_dates(
@@ -4,7 +4,9 @@
 """Progress bar."""
 
 import datetime as dt
+import typing
 
+import pandas as pd
 import tqdm
 
 import codemetrics as cm
@@ -63,21 +65,26 @@ class ProgressBarAdapter:
         # If we are closer to the start date than from the end, we ascend.
         return first_date - self.after < self.now - first_date
 
-    def update(self, current_datetime: dt.datetime):
+    def update(self, current_datetime: typing.Union[dt.datetime, str]):
         """Update the progress bar with current date.
 
         Args:
-            current_datetime: current date being processed.
+            current_datetime: current date being processed. ISO 8601 strings
+                are converted to datetime.
 
         """
         if self.progress_bar is None:
             return
+        if isinstance(current_datetime, str):
+            current_date = pd.Timestamp(current_datetime).to_pydatetime()
+        else:
+            current_date = current_datetime
         if self.ascending is None:
-            self.ascending = self._is_order_ascending(current_datetime)
+            self.ascending = self._is_order_ascending(current_date)
         if self.ascending:
-            new_count = (current_datetime - self.after).days
+            new_count = (current_date - self.after).days
         else:
-            new_count = (self.now - current_datetime).days
+            new_count = (self.now - current_date).days
             assert new_count >= 0, "current_date_time is greater than now"
         diff = new_count - self.count
         if diff > 0:
@@ -99,7 +99,7 @@ class LogEntry:
         self,
         revision: str,
         author: typing.Optional[str],
-        date: dt.datetime,
+        date: typing.Union[dt.datetime, str],
         path: typing.Optional[str] = None,
         message: typing.Optional[str] = None,
         kind: typing.Optional[str] = None,
@@ -116,7 +116,8 @@ class LogEntry:
         Args:
             revision: ID of the revision (given by SCM).
             author: name of the user who committed the change.
-            date: time stamp when code was committed.
+            date: time stamp when code was committed. May be left as an ISO
+                8601 string, see `normalize_log`.
             path: file name that changed.
             message: message accompanying the commit.
             kind: file, directory or property change.
@@ -162,13 +163,13 @@ def normalize_log(df):
         - Replace NaN in author and message with an empty string.
         - Make added, and removed numeric (float so we can handle averages).
         - Make textmods and propmods as bool (no NA).
-        - Make kind, and action categories.
+        - Make author, kind, and action categories.
 
     """
     return df.assign(
         revision=lambda x: x["revision"].astype("string"),
         path=lambda x: x["path"].astype("string"),
-        author=lambda x: x["author"].fillna("").astype("string"),
+        author=lambda x: x["author"].fillna("").astype("category"),
         date=lambda x: pd.to_datetime(x["date"], utc=True),
         message=lambda x: x["message"].fillna("").astype("string"),
         copyfromrev=lambda x: x["copyfromrev"].astype("string"),
@@ -220,7 +221,8 @@ class ScmLogCollector(abc.ABC):
         """Convert output of git log --xml -v to a csv.
 
         Args:
-            cmd_output: iterable of string (one for each line).
+            cmd_output: iterable of string (one for each line) or binary
+                stream, depending on the SCM.
 
         Yields:
             tuple of :class:`codemetrics.scm.LogEntry`.
@@ -230,14 +232,15 @@ class ScmLogCollector(abc.ABC):
 
     def process_log_output_to_df(
         self,
-        cmd_output: typing.Sequence[str],
+        cmd_output: typing.Union[typing.Sequence[str], typing.IO[bytes]],
         after: dt.datetime,
         progress_bar: tqdm.tqdm = None,
     ):
         """Factor creation of dataframe from output of command.
 
         Args:
-            cmd_output: generator returning lines of output from the cmd line.
+            cmd_output: lines of output from the cmd line, or binary stream of
+                the output for SCMs that parse it incrementally (e.g. svn).
             after: date for the oldest change to retrieve. Usefull when
                 progress_bar is specified. Ignored otherwise.
             progress_bar: progress bar if any. Defaults to self.progress_bar.
@@ -280,7 +283,7 @@ def parse_diff_as_tuples(
     """
     curr_chunk, curr_path, count = None, None, 0
     for line in download.content.split("\n"):
-        fm_re = r"Index: (.*)"
+        fm_re = r"Index: (.*?)\r?$"
         # fm_re = r'^\+\+\+ b/[^\s/]+/(.*\S)\s+\((revision \d+|nonexistent)\)'
         file_match = re.match(fm_re, line)
         if file_match is not None:
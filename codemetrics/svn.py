@@ -4,14 +4,14 @@
 """_SvnLogCollector related functions."""
 
 import datetime as dt
+import functools
 import pathlib as pl
 import re
 import subprocess
 import typing
 
-# noinspection PyPep8Naming,PyPep8Naming
-import xml.etree.ElementTree as ET
-
+import dateutil.parser
+import lxml.etree
 import numpy as np
 import pandas as pd
 import tqdm
@@ -21,6 +21,18 @@ from .internals import log
 
 default_client = "svn"
 
+# Attributes of the <path/> elements in svn log --xml -v output.
+_path_attrs = (
+    "text-mods",
+    "kind",
+    "action",
+    "prop-mods",
+    "copyfrom-rev",
+    "copyfrom-path",
+)
+
+_rel_url_re = re.compile(r"^Relative URL: \^(.*)/?$")
+
 
 def to_date(datestr: str):
     """Convert str to datetime.datetime.
@@ -31,9 +43,7 @@ def to_date(datestr: str):
     added and removed columns are set to np.nan for now.
 
     """
-    from dateutil import parser
-
-    return parser.parse(datestr).replace(tzinfo=dt.timezone.utc)
+    return dateutil.parser.parse(datestr).replace(tzinfo=dt.timezone.utc)
 
 
 def to_bool(bool_str: str):
@@ -46,6 +56,25 @@ def to_bool(bool_str: str):
     raise ValueError(f"cannot interpret {bool_str} as a bool")
 
 
+@functools.lru_cache(maxsize=32)
+def _query_relative_url(svn_client: str, cwd: pl.Path) -> str:
+    """Relative URL of the working copy in cwd as reported by svn info.
+
+    The result is cached for the life of the process so collectors created
+    for the same working copy do not run svn info again. Failures raise so
+    they are not cached.
+
+    Raise:
+        ValueError if svn info does not report a relative URL.
+
+    """
+    for line in internals.run([svn_client, "info", "."], cwd=cwd).split("\n"):
+        match = _rel_url_re.match(line)
+        if match:
+            return match.group(1)
+    raise ValueError(f"cannot find the relative url of {cwd} in svn info output")
+
+
 class _SvnLogCollector(scm.ScmLogCollector):
     """_ScmLogCollector interface adapter for _SvnLogCollector."""
 
@@ -72,18 +101,11 @@ class _SvnLogCollector(scm.ScmLogCollector):
         # FIXME: Can we get rid of _relative_url?
         self._relative_url = relative_url
 
-    def update_urls(self) -> typing.Optional[str]:
+    def update_urls(self) -> str:
         """Relative URL so we can generate local paths."""
-        rel_url_re = re.compile(r"^Relative URL: \^(.*)/?$")
         if not self._relative_url:
-            # noinspection PyPep8
-            for line in internals.run(
-                [self.svn_client, "info", "."], cwd=self.cwd
-            ).split("\n"):
-                match = rel_url_re.match(line)
-                if match:
-                    self._relative_url = match.group(1)
-                    break
+            cwd = pl.Path(self.cwd or ".").absolute()
+            self._relative_url = _query_relative_url(self.svn_client, cwd)
         return self._relative_url
 
     @property
@@ -99,66 +121,37 @@ class _SvnLogCollector(scm.ScmLogCollector):
         assert self._relative_url is not None
         return self._relative_url
 
-    @staticmethod
-    def _extract(
-        elem: ET.Element, sub: str, log_entry: str, on_error=None
-    ) -> typing.Optional[str]:
-        """Extract subelement from element."""
-        try:
-            subel = elem.find(f"./{sub}")
-            if subel is not None:
-                return subel.text
-        except (AttributeError, SyntaxError) as err:
-            log.warning("failed to retrieve %s in %s: %s", sub, log_entry, err)
-            if on_error == "raise":
-                raise
-        return None
-
-    def process_entry(self, log_entry: str):
+    def process_entry(self, elem: lxml.etree._Element):
         """Convert a single xml <logentry/> element to csv rows.
 
         Args:
-            log_entry: <logentry/> element.
+            elem: <logentry/> element.
 
         Yields:
             One or more csv rows.
 
         """
-        elem = ET.fromstring(log_entry)
         rev = elem.attrib["revision"]
-        author = self._extract(elem, "author", log_entry)
-        date = self._extract(elem, "date", log_entry, "raise")
-        message = self._extract(elem, "msg", log_entry)
+        author = elem.findtext("author")
+        # Dates are left as ISO strings and converted for the whole column
+        # at once by scm.normalize_log.
+        date = elem.findtext("date")
+        assert date is not None, "expected datetime got None"
+        message = elem.findtext("msg")
         if message is not None:
             message = message.replace("\n", " ")
-        rel_url_slash = self.relative_url + "/"
-        for path_elem in elem.findall("*/path"):
-            other = {}
-            for sub in [
-                "text-mods",
-                "kind",
-                "action",
-                "prop-mods",
-                "copyfrom-rev",
-                "copyfrom-path",
-            ]:
-                try:
-                    other[sub] = path_elem.attrib[sub]
-                except (AttributeError, SyntaxError, KeyError):
-                    other[sub] = np.nan
-            try:
-                path_elem_text = path_elem.text
-                assert path_elem_text is not None
-                path = path_elem_text.replace(rel_url_slash, "")
-            except (AttributeError, SyntaxError, ValueError) as err:
-                msg = f"{err} processing rev {rev}"
-                log.warning(msg)
-                path = msg
-            assert date is not None, "expected datetime got None"
+        for path_elem in elem.iterfind("paths/path"):
+            attrib = path_elem.attrib
+            other = {k: attrib.get(k, np.nan) for k in _path_attrs}
+            # Paths are absolute, see strip_relative_url.
+            path = path_elem.text
+            if path is None:
+                path = f"no path found processing rev {rev}"
+                log.warning(path)
             entry = scm.LogEntry(
                 rev,
                 author,
-                to_date(date),
+                date,
                 path=path,
                 message=message,
                 textmods=to_bool(other["text-mods"]),
@@ -172,20 +165,24 @@ class _SvnLogCollector(scm.ScmLogCollector):
             )
             yield entry
 
-    def process_log_entries(self, xml):
-        # See parent.
-        log_entry = ""
-        for line in xml:
-            if line.startswith("<logentry"):
-                log_entry += line
-                continue
-            if not log_entry:
-                continue
-            log_entry += line
-            if not line.startswith("</logentry>"):
-                continue
-            yield from self.process_entry(log_entry)
-            log_entry = ""
+    def process_log_entries(self, xml: typing.IO[bytes]):
+        """Convert output of svn log --xml -v to log entries.
+
+        Parses the output incrementally, releasing each <logentry/> element
+        once processed so memory use does not grow with the size of the log.
+
+        Args:
+            xml: binary stream containing the xml output.
+
+        Yields:
+            :class:`codemetrics.scm.LogEntry` instances.
+
+        """
+        for _, elem in lxml.etree.iterparse(xml, events=("end",), tag="logentry"):
+            yield from self.process_entry(elem)
+            elem.clear(keep_tail=True)
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
 
     def get_log(
         self,
@@ -226,26 +223,54 @@ class _SvnLogCollector(scm.ScmLogCollector):
             + _SvnLogCollector._args
             + ["-r", f"{after_str}:{before_str}", path]
         )
-        results = internals.run(command, cwd=self.cwd).split("\n")
-        return self.process_log_output_to_df(
-            results, after=after, progress_bar=progress_bar
-        )
+        with internals.run_streaming(command, cwd=self.cwd) as results:
+            df = self.process_log_output_to_df(
+                results, after=after, progress_bar=progress_bar
+            )
+        return self.strip_relative_url(df)
+
+    def strip_relative_url(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Make the paths of the log relative to the working copy.
+
+        svn log reports paths from the root of the repository. The relative
+        url prefix is removed from the whole path column at once.
+
+        Args:
+            df: log with paths as reported by svn log.
+
+        Returns:
+            log with local paths.
+
+        """
+        if df.empty:
+            return df
+        prefix = self.relative_url + "/"
+        paths = df["path"]
+        prefixed = paths.str.startswith(prefix).fillna(False).astype("bool")
+        return df.assign(path=paths.mask(prefixed, paths.str.slice(len(prefix))))
 
 
 class SvnDownloader(scm.ScmDownloader):
     """Download files from Subversion."""
 
     def __init__(
-        self, command: typing.List[str], svn_client: str = None, cwd: pl.Path = None
+        self,
+        command: typing.List[str],
+        svn_client: str = None,
+        cwd: pl.Path = None,
+        cache: bool = False,
     ) -> None:
         """Initialize downloader.
 
         Args:
             svn_client: name of svn client.
+            cache: memoize the output of commands on numbered revisions. Only
+                worth it when the same (revision, path) is downloaded again.
         """
         if not svn_client:
             svn_client = default_client
         super().__init__(command, client=svn_client, cwd=cwd)
+        self.cache = cache
 
     def _download(self, revision: str, path: str = None) -> scm.DownloadResult:
         """Download specific file and revision from git.
@@ -261,10 +286,30 @@ class SvnDownloader(scm.ScmDownloader):
         command = self.command + [revision]
         if path:
             command += [path]
-        content = internals.run(command, cwd=self.cwd)
+        if self.cache and revision.isdigit():
+            cwd = pl.Path(self.cwd or ".").absolute()
+            raw = _run_cached(tuple(command), cwd=cwd)
+        else:
+            raw = internals.run_bytes(command, cwd=self.cwd)
+        # Decode once rather than going through a text-mode pipe.
+        content = raw.decode("utf-8", errors="replace")
         return scm.DownloadResult(revision, path, content)
 
 
+@functools.lru_cache(maxsize=128)
+def _run_cached(command: typing.Tuple[str, ...], cwd: pl.Path = None) -> bytes:
+    """Memoized `internals.run_bytes` for svn commands on a numbered revision.
+
+    The output of a command on a specific revision number does not change, so
+    repeated downloads of the same (revision, path) skip the subprocess call.
+    Revision keywords like HEAD are not cached. cwd must be absolute so the
+    cache does not mix up working copies after a change of directory. Each
+    entry holds a whole file, hence the small size.
+
+    """
+    return internals.run_bytes(list(command), cwd=cwd)
+
+
 def get_diff_stats(
     data: pd.DataFrame, svn_client: str = None, chunks=None, cwd: pl.Path = None
 ) -> typing.Union[None, pd.DataFrame]:
@@ -318,7 +363,6 @@ def get_diff_stats(
 
 
 class SvnProject(scm.Project):
-
     """Project for Subversion SCM."""
 
     def __init__(self, cwd: pl.Path = pl.Path(), client: str = "svn"):
@@ -342,11 +386,13 @@ class SvnProject(scm.Project):
              list of file contents.
 
         """
-        downloader = SvnDownloader(["cat", "-r"], svn_client=self.client, cwd=self.cwd)
-        df = data[["revision", "path"]]
-        if isinstance(df, pd.Series):
-            df = df.to_frame().T
-        revision, path = next(df.itertuples(index=False))
+        downloader = SvnDownloader(
+            ["cat", "-r"], svn_client=self.client, cwd=self.cwd, cache=True
+        )
+        if isinstance(data, pd.Series):
+            revision, path = data["revision"], data["path"]
+        else:
+            revision, path = data["revision"].iat[0], data["path"].iat[0]
         return downloader.download(revision, path)
 
     def get_log(
@@ -4,6 +4,7 @@
 """Tests for `codemetrics` package."""
 
 import datetime as dt
+import importlib.util
 import io
 import textwrap
 import unittest
@@ -161,6 +162,18 @@ class AgeReportTestCase(SimpleRepositoryFixture):
         )
         self.assertEqual(expected, actual)
 
+    def test_ages_by_category_keeps_category_order(self):
+        """Categorical keys come out in category order with the input dtype."""
+        authors = pd.CategoricalDtype(["alice", "elmotec"])
+        self.log["author"] = pd.Categorical(
+            ["elmotec"] * (len(self.log) - 1) + ["alice"], dtype=authors
+        )
+        actual = cm.get_ages(self.log, by=["author"])
+        self.assertEqual(["alice", "elmotec"], actual["author"].tolist())
+        self.assertEqual(
+            authors.categories.tolist(), actual["author"].cat.categories.tolist()
+        )
+
     def test_ages_when_revision_in_index(self):
         """Handle when inpput has path in index."""
         actual = cm.get_ages(self.log.set_index(["revision", "path"]))
@@ -204,6 +217,16 @@ class HotSpotReportTestCase(SimpleRepositoryFixture):
         self.expected.loc[1, "changes"] = 1  # from 2 changes.
         self.assertEqual(self.expected, actual)
 
+    def test_hot_spot_with_multiple_change_metrics(self):
+        """Count one change per distinct combination of the change metrics."""
+        self.log["day"] = dt.datetime(2018, 2, 24, tzinfo=dt.timezone.utc)
+        actual = cm.get_hot_spots(
+            self.log, self.loc, count_one_change_per=["day", "message"]
+        )
+        self.expected.loc[0, "changes"] = 2
+        self.expected.loc[1, "changes"] = 1
+        self.assertEqual(self.expected, actual)
+
     def test_hot_spot_with_na(self):
         """Generate a hot spot report with NA to make sure we don't try to assign 0.0"""
         after = dt.datetime(2018, 2, 26, tzinfo=dt.timezone.utc)
@@ -247,7 +270,8 @@ class CoChangeTestCase(SimpleRepositoryFixture):
         stats.py,requirements.txt,2,1,0.5
         """
                 )
-            )
+            ),
+            dtype={"changes": "int32", "cochanges": "int32"},
         )
         self.assertEqual(expected, actual)
 
@@ -266,8 +290,54 @@ class CoChangeTestCase(SimpleRepositoryFixture):
         stats.py,requirements.txt,1,1,1.0
         """
                 )
-            )
+            ),
+            dtype={"changes": "int32", "cochanges": "int32"},
+        )
+        self.assertEqual(expected, actual)
+
+    def test_co_change_report_ignores_unused_categories(self):
+        """Categories that never changed do not show up in the report."""
+        log = SimpleRepositoryFixture.get_log_df()
+        log["path"] = pd.Categorical(
+            log["path"], categories=["requirements.txt", "stats.py", "unused.py"]
+        )
+        actual = cm.get_co_changes(log=log)
+        self.assertNotIn("unused.py", actual["path"].tolist())
+        self.assertNotIn("unused.py", actual["dependency"].tolist())
+        self.assertEqual(2, len(actual))
+
+    def test_co_change_report_wide_revision(self):
+        """Each pair of paths changed in the same revision is coupled."""
+        log = SimpleRepositoryFixture.get_log_df()
+        log = pd.concat(
+            [log, log.iloc[[2]].assign(path="setup.py").astype({"path": "string"})],
+            ignore_index=True,
+        )
+        actual = cm.get_co_changes(log=log).astype(
+            {"path": "string", "dependency": "string"}
         )
+        expected = pd.read_csv(
+            io.StringIO(
+                textwrap.dedent(
+                    """
+        path,dependency,changes,cochanges,coupling
+        requirements.txt,setup.py,1,1,1.0
+        requirements.txt,stats.py,1,1,1.0
+        setup.py,requirements.txt,1,1,1.0
+        setup.py,stats.py,1,1,1.0
+        stats.py,requirements.txt,2,1,0.5
+        stats.py,setup.py,2,1,0.5
+        """
+                )
+            ),
+            dtype={
+                "path": "string",
+                "dependency": "string",
+                "changes": "int32",
+                "cochanges": "int32",
+            },
+        )
+        actual = actual.sort_values(by=["path", "dependency"]).reset_index(drop=True)
         self.assertEqual(expected, actual)
 
 
@@ -378,6 +448,12 @@ class ComponentTestCase(SimpleRepositoryFixture):
         expected = pd.DataFrame(data={"component": ["parsers", "src.analysis", "test"]})
         self.assertEqual(expected, actual)
 
+    def test_guess_components_with_random_state(self):
+        """Passing a random_state makes the clustering reproducible."""
+        first = cm.guess_components(self.paths, n_clusters=3, random_state=0)
+        second = cm.guess_components(self.paths, n_clusters=3, random_state=0)
+        self.assertEqual(first, second)
+
 
 class GetComplexityTestCase(utils.DataFrameTestCase):
     """Test complexity analysis."""
@@ -502,6 +578,87 @@ class GetComplexityTestCase(utils.DataFrameTestCase):
         actual = self.get_complexity()[expected.columns]
         self.assertEqual(expected.T, actual.T)
 
+    def test_complexity_parallel_matches_groupby_apply(self):
+        """get_complexity_parallel returns the same data as groupby().apply()."""
+        expected = self.get_complexity()
+        project = utils.FakeProject()
+        with mock.patch.object(
+            utils.FakeProject,
+            "download",
+            autospec=True,
+            side_effect=[
+                scm.DownloadResult("r1", "f.py", self.file_content_1),
+                scm.DownloadResult("r2", "f.py", self.file_content_2),
+            ],
+        ):
+            actual = cm.get_complexity_parallel(self.log, project, n_jobs=1)
+        self.assertEqual(expected, actual)
+
+    def test_complexity_parallel_sorted_like_groupby_apply(self):
+        """get_complexity_parallel sorts and types the index like groupby()."""
+        self.log = self.log.iloc[::-1].astype({"revision": "string", "path": "string"})
+        project = utils.ContentProject(
+            {"r1": self.file_content_1, "r2": self.file_content_2}
+        )
+        expected = self.log.groupby(["revision", "path"]).apply(
+            cm.get_complexity, project
+        )
+        actual = cm.get_complexity_parallel(self.log, project, n_jobs=1)
+        self.assertEqual(expected, actual)
+
+    def test_complexity_parallel_multiple_workers(self):
+        """get_complexity_parallel returns the same data with worker processes."""
+        expected = self.get_complexity()
+        project = utils.ContentProject(
+            {"r1": self.file_content_1, "r2": self.file_content_2}
+        )
+        actual = cm.get_complexity_parallel(self.log, project, n_jobs=2)
+        self.assertEqual(expected, actual)
+
+    @unittest.skipUnless(importlib.util.find_spec("dask"), "requires dask")
+    def test_complexity_parallel_with_dask(self):
+        """get_complexity_parallel returns the same data with the dask engine."""
+        expected = self.get_complexity()
+        project = utils.ContentProject(
+            {"r1": self.file_content_1, "r2": self.file_content_2}
+        )
+        actual = cm.get_complexity_parallel(self.log, project, n_jobs=2, engine="dask")
+        self.assertEqual(expected, actual)
+
+    @mock.patch("joblib.Parallel", autospec=True)
+    def test_complexity_parallel_single_job_runs_in_process(self, parallel):
+        """get_complexity_parallel with n_jobs=1 does not go through joblib."""
+        with mock.patch.object(
+            utils.FakeProject,
+            "download",
+            autospec=True,
+            return_value=scm.DownloadResult("r1", "f.py", self.file_content_1),
+        ):
+            cm.get_complexity_parallel(self.log, utils.FakeProject(), n_jobs=1)
+        parallel.assert_not_called()
+
+    def test_complexity_parallel_empty_log(self):
+        """get_complexity_parallel handles logs without any change."""
+        actual = cm.get_complexity_parallel(self.log.iloc[:0], utils.FakeProject())
+        self.assertTrue(actual.empty)
+        self.assertEqual(["revision", "path", "function"], actual.index.names)
+
+    def test_complexity_batch_matches_groupby_apply(self):
+        """get_complexity_batch returns the same data as groupby().apply()."""
+        expected = self.get_complexity()
+        contents = {"r1": self.file_content_1, "r2": self.file_content_2}
+
+        def download(_, data):
+            return scm.DownloadResult(
+                data["revision"], data["path"], contents[data["revision"]]
+            )
+
+        with mock.patch.object(
+            utils.FakeProject, "download", autospec=True, side_effect=download
+        ):
+            actual = cm.get_complexity_batch(self.log, utils.FakeProject())
+        self.assertEqual(expected, actual)
+
     def test_complexity_name_dtype(self):
         """Check the dtypes of the get_complexity return value does not contain object dtype."""
         actual = self.get_complexity()
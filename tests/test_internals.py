@@ -5,10 +5,13 @@
 
 import datetime as dt
 import subprocess
+import sys
 import tempfile
 import unittest
 from unittest import mock
 
+import lxml.etree
+
 import codemetrics.internals as internals
 
 
@@ -115,6 +118,83 @@ class SubprocessRunTest(unittest.TestCase):
         )
 
 
+class SubprocessRunStreamingTest(unittest.TestCase):
+    """Test streaming wrapper around subprocess Popen"""
+
+    def test_output_is_streamed(self):
+        """The context manager yields the binary output of the command"""
+        cmdline = [sys.executable, "-c", "print('a'); print('b')"]
+        with internals.run_streaming(cmdline) as output:
+            actual = output.read().splitlines()
+        self.assertEqual([b"a", b"b"], actual)
+
+    def test_error_shows_in_exception(self):
+        """run_streaming raises ValueError and captures stderr on failure"""
+        cmdline = [sys.executable, "-c", "import sys; sys.exit('the error')"]
+        with self.assertRaises(ValueError) as context:
+            with internals.run_streaming(cmdline) as output:
+                output.read()
+        self.assertRegex(str(context.exception), r"failed to execute .*: the error")
+
+    def test_error_shows_when_output_is_malformed(self):
+        """The command error is reported even when parsing its output failed"""
+        cmdline = [
+            sys.executable,
+            "-c",
+            "import sys; print('<log>', flush=True); sys.exit('the error')",
+        ]
+        with self.assertRaises(ValueError) as context:
+            with internals.run_streaming(cmdline) as output:
+                lxml.etree.parse(output)
+        self.assertRegex(str(context.exception), r"failed to execute .*: the error")
+        self.assertIsInstance(context.exception.__cause__, lxml.etree.XMLSyntaxError)
+
+    def test_consumer_error_when_command_succeeds(self):
+        """Errors of the consumer propagate when the command succeeded"""
+        cmdline = [sys.executable, "-c", "print('<log>')"]
+        with self.assertRaises(lxml.etree.XMLSyntaxError):
+            with internals.run_streaming(cmdline) as output:
+                lxml.etree.parse(output)
+
+    @mock.patch("subprocess.Popen", side_effect=FileNotFoundError())
+    def test_diagnostic_when_file_does_not_exist(self, _):
+        """run_streaming raises ValueError when the command is not found"""
+        with self.assertRaises(ValueError) as context:
+            with internals.run_streaming(["invalid-command"]):
+                pass
+        self.assertRegex(
+            str(context.exception),
+            r"failed to execute invalid-command \(in .*\): file not found",
+        )
+
+
+class SubprocessRunBytesTest(unittest.TestCase):
+    """Test wrapper around subprocess.run returning bytes"""
+
+    def test_output_is_bytes(self):
+        """The output is returned as is, without newline translation"""
+        cmdline = [
+            sys.executable,
+            "-c",
+            "import sys; sys.stdout.buffer.write(b'a\\r\\nb')",
+        ]
+        actual = internals.run_bytes(cmdline)
+        self.assertEqual(b"a\r\nb", actual)
+
+    @mock.patch(
+        "subprocess.run",
+        side_effect=subprocess.CalledProcessError(1, "command", stderr=b"the error"),
+    )
+    def test_error_shows_in_exception(self, _):
+        """run_bytes raises ValueError and decodes stderr from exception"""
+        with self.assertRaises(ValueError) as context:
+            internals.run_bytes(["valid-command"])
+        self.assertRegex(
+            str(context.exception),
+            r"failed to execute valid-command \(in .*\): the error",
+        )
+
+
 class TestCheckRunInRoot(unittest.TestCase):
     """Test check_run_in_root function"""
 
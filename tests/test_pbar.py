@@ -32,3 +32,17 @@ class ProgressBarAdapterTest(unittest.TestCase):
             pb.update(pb.now - dt.timedelta(1))
         expected = [mock.call(9), mock.call(2), mock.call(1)]
         self.assertEqual(tqdm_().update.mock_calls, expected)
+
+    @mock.patch(
+        "codemetrics.internals.get_now",
+        autospec=True,
+        return_value=dt.datetime(2018, 2, 13, tzinfo=dt.timezone.utc),
+    )
+    @mock.patch("tqdm.tqdm", autospec=True)
+    def test_update_with_iso_string(self, tqdm_, _):
+        """ISO 8601 strings are accepted as current date."""
+        after = dt.datetime(2018, 2, 1, tzinfo=dt.timezone.utc)
+        with pbar.ProgressBarAdapter(tqdm.tqdm(), after=after, ascending=True) as pb:
+            pb.update("2018-02-10T11:14:11.000000Z")
+        expected = [mock.call(9), mock.call(3)]
+        self.assertEqual(tqdm_().update.mock_calls, expected)
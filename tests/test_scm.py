@@ -89,7 +89,7 @@ class TestLogEntriesToDataFrame(unittest.TestCase):
 
     def test_dataframe_author_dtype(self):
         """Check dtype in DataFrame."""
-        self.assertEqual("string", self.dtypes["author"].name)
+        self.assertEqual("category", self.dtypes["author"].name)
 
     def test_dataframe_date_dtype(self):
         """Check dtype in DataFrame."""
@@ -3,14 +3,18 @@
 
 """Tests for `codemetrics.svn`"""
 
+import contextlib
 import datetime as dt
 import io
+import os
 import pathlib as pl
 import subprocess
+import tempfile
 import textwrap
 import unittest
 from unittest import mock
 
+import lxml.etree
 import pandas as pd
 
 import codemetrics as cm
@@ -22,7 +26,7 @@ def get_log(dates=None):
     if dates is None:
         dates = [dt.datetime(2018, 2, 24, 11, 14, 11, tzinfo=dt.timezone.utc)]
     retval = textwrap.dedent(
-        """
+        """\
     <?xml version="1.0" encoding="UTF-8"?>
     <log>"""
     )
@@ -49,6 +53,12 @@ def get_log(dates=None):
     return retval
 
 
+@contextlib.contextmanager
+def stream(output: str):
+    """Mimics `codemetrics.internals.run_streaming` for the given output."""
+    yield io.BytesIO(output.encode("utf-8"))
+
+
 class SubversionLogCollectorInitializationTestCase(unittest.TestCase):
     """Test initialization of _SvnLogCollector.
 
@@ -71,6 +81,9 @@ class SubversionLogCollectorInitializationTestCase(unittest.TestCase):
     """
     )
 
+    def setUp(self):
+        cm.svn._query_relative_url.cache_clear()
+
     @mock.patch(
         "codemetrics.internals.run", autospec=True, return_value=svn_log_info_output
     )
@@ -78,9 +91,47 @@ class SubversionLogCollectorInitializationTestCase(unittest.TestCase):
         """Collection of the relative url."""
         log_collector = cm.svn._SvnLogCollector()
         actual = log_collector.relative_url
-        run_.assert_called_with("svn info .".split(), cwd=None)
+        run_.assert_called_with("svn info .".split(), cwd=pl.Path(".").absolute())
         self.assertEqual("/project/trunk", actual)
 
+    @mock.patch("codemetrics.internals.run", autospec=True, return_value="")
+    def test_relative_url_not_found_is_not_cached(self, run_):
+        """svn info runs again when it did not report a relative url."""
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                _ = cm.svn._SvnLogCollector().relative_url
+        self.assertEqual(2, run_.call_count)
+
+    @mock.patch(
+        "codemetrics.internals.run", autospec=True, return_value=svn_log_info_output
+    )
+    def test_relative_url_is_cached(self, run_):
+        """Collectors on the same working copy run svn info only once."""
+        first = cm.svn._SvnLogCollector().relative_url
+        second = cm.svn._SvnLogCollector().relative_url
+        run_.assert_called_once()
+        self.assertEqual(first, second)
+
+
+class StripRelativeUrlTestCase(unittest.TestCase):
+    """Test conversion of repository paths to local paths."""
+
+    def test_only_leading_relative_url_is_stripped(self):
+        """Paths outside of the relative url are left untouched."""
+        collector = cm.svn._SvnLogCollector(relative_url="/project/trunk")
+        log = pd.DataFrame(
+            data={
+                "path": [
+                    "/project/trunk/stats.py",
+                    "/project/branches/b/project/trunk/stats.py",
+                ]
+            },
+            dtype="string",
+        )
+        actual = collector.strip_relative_url(log)["path"].tolist()
+        expected = ["stats.py", "/project/branches/b/project/trunk/stats.py"]
+        self.assertEqual(expected, actual)
+
 
 class GetSvnLogTestCase(unittest.TestCase, test_scm.GetLogTestCase):
     """Given a BaseReport instance."""
@@ -113,7 +164,11 @@ class GetSvnLogTestCase(unittest.TestCase, test_scm.GetLogTestCase):
         )
         self.assertEqual(actual, expected)
 
-    @mock.patch("codemetrics.internals.run", side_effect=[get_log()], autospec=True)
+    @mock.patch(
+        "codemetrics.internals.run_streaming",
+        side_effect=[stream(get_log())],
+        autospec=True,
+    )
     def test_get_log(self, run_):
         """Simple svn run_ returns pandas.DataFrame."""
         actual = self.project.get_log(after=self.after, relative_url="/project/trunk")
@@ -132,10 +187,16 @@ class GetSvnLogTestCase(unittest.TestCase, test_scm.GetLogTestCase):
 
     @mock.patch("tqdm.tqdm", autospec=True)
     @mock.patch(
-        "codemetrics.internals.run",
+        "codemetrics.internals.run_streaming",
         side_effect=[
-            get_log(
-                dates=[dt.date(2018, 12, 4), dt.date(2018, 12, 4), dt.date(2018, 12, 6)]
+            stream(
+                get_log(
+                    dates=[
+                        dt.date(2018, 12, 4),
+                        dt.date(2018, 12, 4),
+                        dt.date(2018, 12, 6),
+                    ]
+                )
             )
         ],
         autospec=True,
@@ -152,10 +213,11 @@ class GetSvnLogTestCase(unittest.TestCase, test_scm.GetLogTestCase):
         progress_bar.close.assert_called_once()
 
     @mock.patch(
-        "codemetrics.internals.run",
+        "codemetrics.internals.run_streaming",
         side_effect=[
-            textwrap.dedent(
-                """
+            stream(
+                textwrap.dedent(
+                    """\
     <?xml version="1.0" encoding="UTF-8"?>
     <log>
     <logentry revision="1018">
@@ -166,6 +228,7 @@ class GetSvnLogTestCase(unittest.TestCase, test_scm.GetLogTestCase):
     <msg/>
     </logentry>
     </log>"""
+                )
             )
         ],
         autospec=True,
@@ -183,10 +246,11 @@ class GetSvnLogTestCase(unittest.TestCase, test_scm.GetLogTestCase):
         self.assertEqual(expected, df)
 
     @mock.patch(
-        "codemetrics.internals.run",
+        "codemetrics.internals.run_streaming",
         side_effect=[
-            textwrap.dedent(
-                """
+            stream(
+                textwrap.dedent(
+                    """\
     <?xml version="1.0" encoding="UTF-8"?>
     <log>
     <logentry revision="1018">
@@ -197,6 +261,7 @@ class GetSvnLogTestCase(unittest.TestCase, test_scm.GetLogTestCase):
     </logentry>
     </log>
     """
+                )
             )
         ],
         autospec=True,
@@ -216,7 +281,11 @@ class GetSvnLogTestCase(unittest.TestCase, test_scm.GetLogTestCase):
         )
         self.assertEqual(expected, actual)
 
-    @mock.patch("codemetrics.internals.run", autospec=True)
+    @mock.patch(
+        "codemetrics.internals.run_streaming",
+        autospec=True,
+        side_effect=[stream("<log/>")],
+    )
     def test_program_name(self, run):
         """Test program_name taken into account."""
         self.project.client = "svn-1.7"
@@ -225,6 +294,16 @@ class GetSvnLogTestCase(unittest.TestCase, test_scm.GetLogTestCase):
             "svn-1.7 log --xml -v -r {2018-12-03}:HEAD .".split(), cwd="<root>"
         )
 
+    @mock.patch(
+        "codemetrics.internals.run_streaming",
+        autospec=True,
+        side_effect=[stream("<log><logentry revision='1'></log>")],
+    )
+    def test_malformed_xml_raises(self, _):
+        """Malformed svn output is reported as a parse error."""
+        with self.assertRaises(lxml.etree.XMLSyntaxError):
+            self.project.get_log(after=self.after, relative_url="/project/trunk")
+
     def test_assert_when_no_tzinfo(self):
         """Test we get a proper message when the start date is not tz-aware."""
         after_no_tzinfo = self.after.replace(tzinfo=None)
@@ -233,10 +312,11 @@ class GetSvnLogTestCase(unittest.TestCase, test_scm.GetLogTestCase):
         self.assertIn("tzinfo-aware", str(context.exception))
 
     @mock.patch(
-        "codemetrics.internals.run",
+        "codemetrics.internals.run_streaming",
         side_effect=[
-            textwrap.dedent(
-                """
+            stream(
+                textwrap.dedent(
+                    """\
     <?xml version="1.0" encoding="UTF-8"?>
     <log>
     <logentry revision="1018">
@@ -251,6 +331,7 @@ class GetSvnLogTestCase(unittest.TestCase, test_scm.GetLogTestCase):
     </logentry>
     </log>
     """
+                )
             )
         ],
         autospec=True,
@@ -293,24 +374,33 @@ class SubversionDownloadTestCase(unittest.TestCase):
     )
 
     def setUp(self):
+        cm.svn._run_cached.cache_clear()
         self.svn = cm.svn.SvnDownloader("cat -r".split())
         self.sublog = pd.DataFrame(
             data={"revision": ["1", "2"], "path": ["file.py"] * 2}
         )
 
-    @mock.patch("codemetrics.internals.run", autospec=True, return_value=content1)
+    @mock.patch(
+        "codemetrics.internals.run_bytes", autospec=True, return_value=content1.encode()
+    )
     def test_svn_arguments(self, _run):
         cm.svn.SvnProject().download(self.sublog.iloc[0])
-        _run.assert_called_with(self.svn.command + ["1", "file.py"], cwd=pl.Path("."))
+        _run.assert_called_with(
+            self.svn.command + ["1", "file.py"], cwd=pl.Path(".").absolute()
+        )
 
-    @mock.patch("codemetrics.internals.run", autospec=True, return_value=content1)
+    @mock.patch(
+        "codemetrics.internals.run_bytes", autospec=True, return_value=content1.encode()
+    )
     def test_single_revision_download(self, _run):
         actual = cm.svn.SvnProject().download(self.sublog.iloc[0])
         expected = cm.scm.DownloadResult("1", "file.py", self.content1)
         self.assertEqual(expected, actual)
 
     @mock.patch(
-        "codemetrics.internals.run", autospec=True, side_effect=[content1, content2]
+        "codemetrics.internals.run_bytes",
+        autospec=True,
+        side_effect=[content1.encode(), content2.encode()],
     )
     def test_multiple_revision_download(self, _run):
         actual = self.sublog.apply(cm.svn.SvnProject().download, axis=1).tolist()
@@ -320,10 +410,54 @@ class SubversionDownloadTestCase(unittest.TestCase):
         ]
         self.assertEqual(expected, actual)
 
+    @mock.patch(
+        "codemetrics.internals.run_bytes", autospec=True, return_value=content1.encode()
+    )
+    def test_repeated_download_runs_svn_once(self, _run):
+        """Downloading the same revision and path twice only calls svn once."""
+        project = cm.svn.SvnProject()
+        first = project.download(self.sublog.iloc[0])
+        second = project.download(self.sublog.iloc[0])
+        _run.assert_called_once()
+        self.assertEqual(first, second)
+
+    @mock.patch(
+        "codemetrics.internals.run_bytes",
+        autospec=True,
+        side_effect=[content1.encode(), content2.encode()],
+    )
+    def test_download_after_change_of_directory(self, _run):
+        """The cache does not mix up working copies after os.chdir."""
+        project = cm.svn.SvnProject()
+        initial_dir = os.getcwd()
+        with tempfile.TemporaryDirectory() as wc1, tempfile.TemporaryDirectory() as wc2:
+            try:
+                os.chdir(wc1)
+                first = project.download(self.sublog.iloc[0])
+                os.chdir(wc2)
+                second = project.download(self.sublog.iloc[0])
+            finally:
+                os.chdir(initial_dir)
+        self.assertEqual(2, _run.call_count)
+        self.assertEqual(self.content1, first.content)
+        self.assertEqual(self.content2, second.content)
+
+    @mock.patch(
+        "codemetrics.internals.run_bytes", autospec=True, return_value=b"\xc3\xa9\xff"
+    )
+    def test_undecodable_content_is_replaced(self, _):
+        """Invalid UTF-8 in the svn output does not fail the download."""
+        actual = cm.svn.SvnProject().download(self.sublog.iloc[0])
+        self.assertEqual("\u00e9\ufffd", actual.content)
+
 
 class SubversionGetDiffStatsTestCase(utils.DataFrameTestCase):
     """Given a subversion repository and file chunks."""
 
+    def setUp(self):
+        super().setUp()
+        cm.svn._run_cached.cache_clear()
+
     diffs = textwrap.dedent(
         r'''
     Index: estimate/__init__.py
@@ -436,27 +570,37 @@ class SubversionGetDiffStatsTestCase(utils.DataFrameTestCase):
         dtype={"revision": "str", "path": "str"},
     )
 
-    @mock.patch("codemetrics.internals.run", autospec=True, return_value=diffs)
+    @mock.patch(
+        "codemetrics.internals.run_bytes", autospec=True, return_value=diffs.encode()
+    )
     def test_called_command_line(self, run_):
         """Can retrieve chunk statistics from Subversion"""
         cm.svn.get_diff_stats(self.log, cwd="<root>")
         run_.assert_called_once_with("svn diff --git -c 1014 .".split(), cwd="<root>")
 
-    @mock.patch("codemetrics.internals.run", autospec=True, return_value=diffs)
+    @mock.patch(
+        "codemetrics.internals.run_bytes", autospec=True, return_value=diffs.encode()
+    )
     def test_direct_call(self, _):
         """Direct call to cm.svn.get_diff_stats"""
         actual = cm.svn.get_diff_stats(self.log)
         expected = self.expected.drop(columns=["revision"]).set_index(["path", "chunk"])
         self.assertEqual(expected, actual)
 
-    @mock.patch("codemetrics.internals.run", autospec=True, return_value=diffs)
+    @mock.patch(
+        "codemetrics.internals.run_bytes", autospec=True, return_value=diffs.encode()
+    )
     def test_direct_call_with_indexed_data(self, _):
         """Direct call to cm.svn.get_diff_stats"""
         actual = cm.svn.get_diff_stats(self.log.set_index(["revision", "path"]))
         expected = self.expected.drop(columns=["revision"]).set_index(["path", "chunk"])
         self.assertEqual(expected, actual)
 
-    @mock.patch("codemetrics.internals.run", autospec=True, side_effect=[diffs, diffs])
+    @mock.patch(
+        "codemetrics.internals.run_bytes",
+        autospec=True,
+        side_effect=[diffs.encode()] * 2,
+    )
     def test_get_chunk_stats_with_groupby_apply(self, _):
         """Can retrieve chunk statistics from Subversion"""
         actual = self.log.groupby(["revision"]).apply(cm.svn.get_diff_stats)
@@ -465,7 +609,11 @@ class SubversionGetDiffStatsTestCase(utils.DataFrameTestCase):
         )
         self.assertEqual(expected, actual)
 
-    @mock.patch("codemetrics.internals.run", autospec=True, side_effect=[diffs, diffs])
+    @mock.patch(
+        "codemetrics.internals.run_bytes",
+        autospec=True,
+        side_effect=[diffs.encode()] * 2,
+    )
     def test_get_stats_with_groupby_apply(self, _):
         """Can retrieve chunk statistics from Subversion"""
         actual = self.log.groupby(["revision"]).apply(
@@ -478,7 +626,18 @@ class SubversionGetDiffStatsTestCase(utils.DataFrameTestCase):
         )
         self.assertEqual(expected, actual)
 
-    @mock.patch("codemetrics.internals.run", autospec=True)
+    @mock.patch(
+        "codemetrics.internals.run_bytes",
+        autospec=True,
+        side_effect=[diffs.encode()] * 2,
+    )
+    def test_diffs_are_not_cached(self, run_):
+        """Diffs of a revision are not kept around after use."""
+        cm.svn.get_diff_stats(self.log)
+        cm.svn.get_diff_stats(self.log)
+        self.assertEqual(2, run_.call_count)
+
+    @mock.patch("codemetrics.internals.run_bytes", autospec=True)
     def test_error_generates_warning(self, run_):
         """Can retrieve chunk statistics from Subversion"""
         exception = subprocess.CalledProcessError(1, cmd="svn", stderr="some error")
@@ -491,7 +650,7 @@ class SubversionGetDiffStatsTestCase(utils.DataFrameTestCase):
         )
         self.assertEqual([expected], context.output)
 
-    @mock.patch("codemetrics.internals.run", autospec=True)
+    @mock.patch("codemetrics.internals.run_bytes", autospec=True)
     def test_empty_diff(self, run):
         """Direct call when svn returns an empty data frame"""
         run.return_value = textwrap.dedent(
@@ -503,7 +662,7 @@ class SubversionGetDiffStatsTestCase(utils.DataFrameTestCase):
         --- a/estimate/connect_jupyter_on_desktop1.sh   (nonexistent)
         +++ b/estimate/connect_jupyter_on_desktop1.sh   (revision 899)
         """
-        )
+        ).encode()
         actual = cm.svn.get_diff_stats(self.log)
         expected = pd.read_csv(
             io.StringIO(
@@ -517,7 +676,7 @@ class SubversionGetDiffStatsTestCase(utils.DataFrameTestCase):
         )
         self.assertEqual(expected, actual)
 
-    @mock.patch("codemetrics.internals.run", autospec=True)
+    @mock.patch("codemetrics.internals.run_bytes", autospec=True)
     def test_single_diff_line(self, run):
         """Direct call to cm.svn.get_diff_stats when svn returns single line"""
         run.return_value = textwrap.dedent(
@@ -531,7 +690,7 @@ class SubversionGetDiffStatsTestCase(utils.DataFrameTestCase):
         @@ -0,0 +1 @@
         +ssh -NL 8888:localhost:8888 elmotec@desktop1
         """
-        )
+        ).encode()
         actual = cm.svn.get_diff_stats(self.log)
         expected = pd.read_csv(
             io.StringIO(
@@ -546,7 +705,7 @@ class SubversionGetDiffStatsTestCase(utils.DataFrameTestCase):
         )
         self.assertEqual(expected, actual)
 
-    @mock.patch("codemetrics.internals.run", autospec=True)
+    @mock.patch("codemetrics.internals.run_bytes", autospec=True)
     def test_handle_files_with_spaces_in_name(self, run):
         """Files that have spaces in the name are handled correctly."""
         run.return_value = textwrap.dedent(
@@ -560,7 +719,7 @@ class SubversionGetDiffStatsTestCase(utils.DataFrameTestCase):
         @@ -0,0 +1,1 @@
         +#!/usr/bin/env python
         """
-        )
+        ).encode()
         actual = cm.svn.get_diff_stats(self.log)
         expected = pd.read_csv(
             io.StringIO(
@@ -575,7 +734,19 @@ class SubversionGetDiffStatsTestCase(utils.DataFrameTestCase):
         )
         self.assertEqual(expected, actual)
 
-    @mock.patch("codemetrics.internals.run", autospec=True)
+    @mock.patch("codemetrics.internals.run_bytes", autospec=True)
+    def test_handle_windows_line_endings(self, run):
+        """The carriage return is not part of the path."""
+        run.return_value = (
+            b"Index: setup.py\r\n"
+            b"===================================================================\r\n"
+            b"@@ -0,0 +1,1 @@\r\n"
+            b"+#!/usr/bin/env python\r\n"
+        )
+        actual = cm.svn.get_diff_stats(self.log, chunks=False)
+        self.assertEqual(["setup.py"], actual.index.tolist())
+
+    @mock.patch("codemetrics.internals.run_bytes", autospec=True)
     def test_deleted_files(self, run):
         """Files that were deleted."""
         run.return_value = textwrap.dedent(
@@ -590,7 +761,7 @@ class SubversionGetDiffStatsTestCase(utils.DataFrameTestCase):
         -# A generic, single database configuration.
         -
         """
-        )
+        ).encode()
         actual = cm.svn.get_diff_stats(self.log)
         expected = pd.read_csv(
             io.StringIO(
@@ -605,7 +776,7 @@ class SubversionGetDiffStatsTestCase(utils.DataFrameTestCase):
         )
         self.assertEqual(expected, actual)
 
-    @mock.patch("codemetrics.internals.run", autospec=True)
+    @mock.patch("codemetrics.internals.run_bytes", autospec=True)
     def test_use_index_to_id_file_in_branches(self, run):
         """Handles a weird bug in Subversion
 
@@ -623,7 +794,7 @@ class SubversionGetDiffStatsTestCase(utils.DataFrameTestCase):
         @@ -0,0 +1,1 @@
         +#!/usr/bin/env python
         """
-        )
+        ).encode()
         actual = cm.svn.get_diff_stats(self.log)
         expected = pd.read_csv(
             io.StringIO(
@@ -645,7 +816,14 @@ class SubversionProjectTestCase(unittest.TestCase, test_scm.CommonProjectTestCas
     Project = cm.svn.SvnProject
 
     def setUp(self):
-        pass
+        cm.svn._run_cached.cache_clear()
+
+    @mock.patch(
+        "codemetrics.internals.run_bytes", autospec=True, return_value=b"dummy content"
+    )
+    def test_download_return_single_result(self, _):
+        """Makes sure the download function returns a DownloadResult."""
+        super().test_download_return_single_result()
 
 
 if __name__ == "__main__":
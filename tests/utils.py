@@ -6,6 +6,7 @@
 
 
 import io
+import typing
 import unittest
 
 import pandas as pd
@@ -96,3 +97,24 @@ class FakeProject(scm.Project):
 
     def get_log(self, **kwargs) -> pd.DataFrame:
         pass
+
+
+class ContentProject(FakeProject):
+    """Picklable project returning pre-determined content by revision.
+
+    Defined at module level so it can be sent to worker processes.
+
+    """
+
+    def __init__(self, contents: typing.Dict[str, str]):
+        super().__init__()
+        self.contents = contents
+
+    def download(
+        self, data: typing.Union[pd.DataFrame, pd.Series]
+    ) -> scm.DownloadResult:
+        if isinstance(data, pd.Series):
+            revision, path = data["revision"], data["path"]
+        else:
+            revision, path = data["revision"].iat[0], data["path"].iat[0]
+        return scm.DownloadResult(revision, path, self.contents[revision])